@@ -0,0 +1,68 @@
+# 比较旧的字典文档块与Chunk记录的内存占用（tracemalloc）
+# 用法: python benchmark_chunk_memory.py --chunks 1000000 --files 2000
+import gc
+import argparse
+import tracemalloc
+
+from chunk_record import Chunk, get_file_info
+
+
+def build_dict_chunks(contents, files):
+    """按旧版 TextSplitter.split_documents 的结构构建字典（同一文件的路径字符串共享）"""
+    filenames = [filepath.split("/")[-1] for filepath in files]
+    chunks = []
+    for i, content in enumerate(contents):
+        filepath = files[i % len(files)]
+        chunks.append({
+            "content": content,
+            "filename": filenames[i % len(files)],
+            "filepath": filepath,
+            "filetype": ".txt",
+            "page_number": 0,
+            "chunk_id": i,
+            "images": [],
+        })
+    return chunks
+
+
+def build_record_chunks(contents, files):
+    chunks = []
+    for i, content in enumerate(contents):
+        chunks.append(Chunk(content=content, file=get_file_info(files[i % len(files)]), chunk_id=i))
+    return chunks
+
+
+def measure(builder, contents, files):
+    """返回构建结果额外占用的字节数（不含两种方式共享的正文字符串）"""
+    gc.collect()
+    tracemalloc.start()
+    result = builder(contents, files)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文档块内存占用对比")
+    parser.add_argument("--chunks", type=int, default=200000)
+    parser.add_argument("--files", type=int, default=500)
+    args = parser.parse_args()
+
+    files = [f"./data/course_{i:05d}/lecture_{i:05d}.txt" for i in range(args.files)]
+    # 正文在两种结构中共享，只比较结构本身的开销
+    contents = [f"chunk {i}" for i in range(args.chunks)]
+
+    dict_current, dict_peak = measure(build_dict_chunks, contents, files)
+    record_current, record_peak = measure(build_record_chunks, contents, files)
+
+    print(f"文档块数量: {args.chunks}，文件数量: {args.files}")
+    print(f"字典:  {dict_current / 2**20:8.1f} MiB（峰值 {dict_peak / 2**20:.1f} MiB），"
+          f"每块 {dict_current / args.chunks:.0f} 字节")
+    print(f"Chunk: {record_current / 2**20:8.1f} MiB（峰值 {record_peak / 2**20:.1f} MiB），"
+          f"每块 {record_current / args.chunks:.0f} 字节")
+    print(f"节省:  {(1 - record_current / dict_current) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import weakref
+from typing import Dict, Optional, Sequence, Tuple
+
+
+class FileInfo:
+    """文件级元数据，同一文件的所有文档块共享一个实例"""
+
+    # __weakref__ 供文件元数据表弱引用
+    __slots__ = ("filename", "filepath", "filetype", "__weakref__")
+
+    def __init__(self, filename: str, filepath: str, filetype: str):
+        self.filename = filename
+        self.filepath = filepath
+        self.filetype = filetype
+
+    def __repr__(self) -> str:
+        return f"FileInfo(filepath={self.filepath!r})"
+
+
+# 文件元数据表：同一文件共享一个实例，字符串经过intern
+# 弱引用：文件的文档块全部释放后条目自动移除，监听模式长期运行时不会累积已删除或改名的文件
+_file_infos: "weakref.WeakValueDictionary[Tuple[str, str, str], FileInfo]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+def get_file_info(filepath: str, filename: Optional[str] = None, filetype: Optional[str] = None) -> FileInfo:
+    """获取文件对应的共享元数据"""
+    if filename is None:
+        filename = os.path.basename(filepath)
+    if filetype is None:
+        filetype = os.path.splitext(filepath)[1].lower()
+
+    key = (filepath, filename, filetype)
+    info = _file_infos.get(key)
+    if info is None:
+        info = FileInfo(sys.intern(filename), sys.intern(filepath), sys.intern(filetype))
+        # 并发插入时返回已存在的实例
+        info = _file_infos.setdefault(key, info)
+    return info
+
+
+class Chunk:
+    """文档块记录，文件名/路径/类型通过共享的FileInfo访问"""
+
+    __slots__ = ("content", "file", "page_number", "chunk_id", "images")
+
+    def __init__(
+        self,
+        content: str,
+        file: FileInfo,
+        page_number: int = 0,
+        chunk_id: int = 0,
+        images: Sequence = (),
+    ):
+        self.content = content
+        self.file = file
+        self.page_number = page_number
+        self.chunk_id = chunk_id
+        # 没有图片时共享同一个空元组
+        self.images = tuple(images) if images else ()
+
+    @property
+    def filename(self) -> str:
+        return self.file.filename
+
+    @property
+    def filepath(self) -> str:
+        return self.file.filepath
+
+    @property
+    def filetype(self) -> str:
+        return self.file.filetype
+
+    def to_dict(self) -> Dict:
+        """转换为字典，用于写入JSON"""
+        return {
+            "content": self.content,
+            "filename": self.filename,
+            "filepath": self.filepath,
+            "filetype": self.filetype,
+            "page_number": self.page_number,
+            "chunk_id": self.chunk_id,
+            "images": list(self.images),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Chunk":
+        """从字典恢复文档块"""
+        file = get_file_info(
+            data.get("filepath", ""), data.get("filename", "unknown"), data.get("filetype", "")
+        )
+        return cls(
+            content=data.get("content", ""),
+            file=file,
+            page_number=data.get("page_number", 0),
+            chunk_id=data.get("chunk_id", 0),
+            images=data.get("images", ()),
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"Chunk(filename={self.filename!r}, page_number={self.page_number}, "
+            f"chunk_id={self.chunk_id}, content_length={len(self.content)})"
+        )
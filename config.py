@@ -14,7 +14,41 @@ COLLECTION_NAME = "course_materials"
 # 文本处理配置
 CHUNK_SIZE = 500  # 每个文本块的长度
 CHUNK_OVERLAP = 50  # 重叠长度
+TXT_STREAM_THRESHOLD = 20 * 1024 * 1024  # 超过该字节数的TXT文件流式读取和切分
+TXT_STREAM_BLOCK_SIZE = 1024 * 1024  # 流式读取时每次读入的字符数
+TXT_ENCODING_SAMPLE_SIZE = 64 * 1024  # 流式读取时用于检测编码的样本字节数
 MAX_TOKENS = 2000  # 生成回答的最大长度
 
 # RAG配置
-TOP_K = 3  # 每次检索的文档块数量
\ No newline at end of file
+TOP_K = 3  # 每次检索的文档块数量
+
+# 索引快照配置
+SNAPSHOT_DIR = "./snapshot"
+SNAPSHOT_BATCH_SIZE = 1000  # 导出/导入时每批处理的文档块数量
+SNAPSHOT_DTYPE = "float32"  # 向量存储精度：float32 或 float16
+
+# 数据导入配置
+INGEST_CHECKPOINT_FILE = "ingest_checkpoint.txt"  # 已提交块ID记录，位于向量数据库目录下
+DEAD_LETTER_FILE = "dead_letter.jsonl"  # 持续失败的块，位于向量数据库目录下
+FILE_STATE_FILE = "file_state.json"  # 已导入文件的修改时间和大小，位于向量数据库目录下
+WRITE_BATCH_SIZE = 256  # 按文件替换时每批embedding并写入的块数（不超过ChromaDB的最大批量）
+
+# 接口限流配置（embedding和对话接口共享同一额度）
+RATE_LIMIT_REQUESTS_PER_MINUTE = 60  # 每分钟最大请求数
+RATE_LIMIT_TOKENS_PER_MINUTE = 100000  # 每分钟最大token数
+RATE_LIMIT_MAX_RETRIES = 5  # 遇到429或临时错误时的最大重试次数
+
+# 批量问答配置
+EMBEDDING_BATCH_SIZE = 25  # 单次embedding请求的最大文本数（百炼text-embedding-v2上限为25）
+QUERY_BATCH_SIZE = 500  # 单次向量检索的最大查询数
+ANSWER_MAX_WORKERS = 8  # 批量生成回答时的最大并发数
+
+# 监听模式配置
+WATCH_POLL_INTERVAL = 5.0  # 扫描数据目录的间隔秒数
+WATCH_DEBOUNCE_SECONDS = 10.0  # 文件停止变化多少秒后再导入
+WATCH_MAX_RETRIES = 3  # 同步失败后的最大重试次数，每次等待时间翻倍
+
+# 对话记忆配置
+MEMORY_TOKEN_BUDGET = 1500  # 对话历史（摘要+近期对话）在提示词中的token上限
+MEMORY_RECENT_TURNS = 2  # 始终原样保留的最近对话轮数
+MEMORY_SUMMARY_MAX_TOKENS = 300  # 摘要的最大长度
@@ -0,0 +1,171 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from openai import OpenAI
+
+from config import (
+    MODEL_NAME,
+    MEMORY_TOKEN_BUDGET,
+    MEMORY_RECENT_TURNS,
+    MEMORY_SUMMARY_MAX_TOKENS,
+)
+from rate_limiter import get_rate_limiter, estimate_tokens, PRIORITY_BULK
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """将文本截断到大约max_tokens个token"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    suffix = "……（已截断）"
+    return text[:max((max_tokens - estimate_tokens(suffix)) * 2, 0)] + suffix
+
+
+class ConversationMemory:
+    """带token预算的对话记忆
+
+    最近的recent_turns轮对话始终放入提示词（超出预算时截断回答）；更早的对话在预算内原样保留，
+    超出预算时在后台压缩进滚动摘要，不阻塞当前回答。放不下的旧对话一定已在压缩队列中。
+    """
+
+    def __init__(
+        self,
+        client: OpenAI,
+        model: str = MODEL_NAME,
+        token_budget: int = MEMORY_TOKEN_BUDGET,
+        recent_turns: int = MEMORY_RECENT_TURNS,
+    ):
+        self.client = client
+        self.model = model
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+
+        self.summary = ""
+        # 尚未压缩进摘要的对话：(学生问题, 助教回答)
+        self._turns: List[Tuple[str, str]] = []
+
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._summarizing = False
+
+    def add_turn(self, query: str, answer: str) -> None:
+        """记录一轮对话"""
+        with self._lock:
+            self._turns.append((query, answer))
+        self._maybe_summarize()
+
+    def messages(self) -> List[Dict]:
+        """返回放入提示词的历史消息，总长度不超过token预算"""
+        with self._lock:
+            summary = self.summary
+            turns = list(self._turns)
+
+        budget = self.token_budget
+        history = []
+        if summary:
+            summary_message = {"role": "system", "content": f"此前对话的摘要：{summary}"}
+            history.append(summary_message)
+            budget -= estimate_tokens(summary_message["content"])
+
+        recent_count = min(self.recent_turns, len(turns))
+        older = turns[:len(turns) - recent_count]
+        recent = turns[len(turns) - recent_count:]
+
+        # 最近的对话始终保留，放不下时平均分配剩余预算并截断
+        recent_cost = sum(estimate_tokens(query) + estimate_tokens(answer) for query, answer in recent)
+        if recent_cost > budget and recent:
+            share = max(budget // len(recent), 0)
+            truncated = []
+            for query, answer in recent:
+                query = _truncate_to_tokens(query, share // 2)
+                answer = _truncate_to_tokens(answer, max(share - estimate_tokens(query), 0))
+                truncated.append((query, answer))
+            recent = truncated
+            budget = 0
+        else:
+            budget -= recent_cost
+
+        # 较早的对话从近到远放入，放不下的留给摘要
+        kept_older = []
+        for query, answer in reversed(older):
+            cost = estimate_tokens(query) + estimate_tokens(answer)
+            if cost > budget:
+                break
+            budget -= cost
+            kept_older.insert(0, (query, answer))
+
+        if len(kept_older) < len(older):
+            # 确保未放入提示词的旧对话正在或即将被压缩进摘要
+            self._maybe_summarize()
+
+        for query, answer in kept_older + recent:
+            history.append({"role": "user", "content": query})
+            history.append({"role": "assistant", "content": answer})
+        return history
+
+    def history_tokens(self) -> int:
+        """估计当前历史消息占用的token数"""
+        return sum(estimate_tokens(message["content"]) for message in self.messages())
+
+    def _maybe_summarize(self) -> None:
+        """历史超出预算时，在后台把尚未进入摘要的较早对话压缩进摘要"""
+        with self._lock:
+            if self._summarizing:
+                return
+
+            total = estimate_tokens(self.summary) + sum(
+                estimate_tokens(query) + estimate_tokens(answer) for query, answer in self._turns
+            )
+            # _turns中只有尚未进入摘要的对话，最近的recent_turns轮不参与压缩
+            old_count = len(self._turns) - self.recent_turns
+            if total <= self.token_budget or old_count <= 0:
+                return
+
+            old_turns = self._turns[:old_count]
+            summary = self.summary
+            self._summarizing = True
+        self._executor.submit(self._summarize, summary, old_turns)
+
+    def _summarize(self, summary: str, old_turns: List[Tuple[str, str]]) -> None:
+        dialogue = "\n".join(f"学生：{query}\n助教：{answer}" for query, answer in old_turns)
+        prompt = f"""请将以下课程答疑对话压缩为简洁的摘要，保留学生关心的问题、涉及的概念和结论，以及引用过的课程材料来源。
+
+已有摘要：
+{summary if summary else '（无）'}
+
+新的对话：
+{dialogue}
+
+请直接输出更新后的摘要："""
+
+        try:
+            response = get_rate_limiter().call(
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.3,
+                    max_tokens=MEMORY_SUMMARY_MAX_TOKENS
+                ),
+                estimated_tokens=estimate_tokens(prompt) + MEMORY_SUMMARY_MAX_TOKENS,
+                priority=PRIORITY_BULK,
+            )
+            new_summary = response.choices[0].message.content.strip()
+        except Exception as e:
+            # 摘要失败时保留原对话，下次读取或添加对话时重试
+            print(f"\n生成对话摘要失败: {str(e)}")
+            with self._lock:
+                self._summarizing = False
+            return
+
+        with self._lock:
+            # 摘要期间只会追加新对话，被压缩的对话仍在列表开头
+            self.summary = new_summary
+            self._turns = self._turns[len(old_turns):]
+            self._summarizing = False
+
+        # 摘要期间新增的对话可能仍超出预算
+        self._maybe_summarize()
+
+    def close(self) -> None:
+        """停止后台摘要线程"""
+        self._executor.shutdown(wait=False)
@@ -1,9 +1,11 @@
 import os
-from typing import List, Dict, Optional
+import codecs
+from typing import Iterator, List, Dict, Optional
 import docx2txt
 from PyPDF2 import PdfReader
 from pptx import Presentation
-from config import DATA_DIR
+from config import DATA_DIR, TXT_STREAM_THRESHOLD, TXT_STREAM_BLOCK_SIZE, TXT_ENCODING_SAMPLE_SIZE
+from chunk_record import Chunk, get_file_info
 
 class DocumentLoader:
     def __init__(
@@ -13,8 +15,8 @@ class DocumentLoader:
         self.data_dir = data_dir
         self.supported_formats = [".pdf", ".pptx", ".docx", ".txt"]
 
-    def load_pdf(self, file_path: str) -> List[Dict]:
-        """加载PDF文件，按页返回内容"""
+    def load_pdf(self, file_path: str, strict: bool = False) -> List[Dict]:
+        """加载PDF文件，按页返回内容，strict为True时出错直接抛出"""
         try:
             reader = PdfReader(file_path)
             pages = []
@@ -30,10 +32,12 @@ class DocumentLoader:
             return pages
         except Exception as e:
             print(f"加载PDF文件出错: {file_path}, 错误: {str(e)}")
+            if strict:
+                raise
             return []
 
-    def load_pptx(self, file_path: str) -> List[Dict]:
-        """加载PPT文件，按幻灯片返回内容"""
+    def load_pptx(self, file_path: str, strict: bool = False) -> List[Dict]:
+        """加载PPT文件，按幻灯片返回内容，strict为True时出错直接抛出"""
         try:
             prs = Presentation(file_path)
             slides = []
@@ -57,20 +61,24 @@ class DocumentLoader:
             return slides
         except Exception as e:
             print(f"加载PPTX文件出错: {file_path}, 错误: {str(e)}")
+            if strict:
+                raise
             return []
 
-    def load_docx(self, file_path: str) -> str:
-        """加载DOCX文件"""
+    def load_docx(self, file_path: str, strict: bool = False) -> str:
+        """加载DOCX文件，strict为True时出错直接抛出"""
         try:
             # 使用docx2txt提取文本
             text = docx2txt.process(file_path)
             return text
         except Exception as e:
             print(f"加载DOCX文件出错: {file_path}, 错误: {str(e)}")
+            if strict:
+                raise
             return ""
 
-    def load_txt(self, file_path: str) -> str:
-        """加载TXT文件"""
+    def load_txt(self, file_path: str, strict: bool = False) -> str:
+        """加载TXT文件，strict为True时出错直接抛出"""
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 return f.read()
@@ -81,71 +89,111 @@ class DocumentLoader:
                     return f.read()
             except Exception as e:
                 print(f"加载TXT文件出错（编码问题）: {file_path}, 错误: {str(e)}")
+                if strict:
+                    raise
                 return ""
         except Exception as e:
             print(f"加载TXT文件出错: {file_path}, 错误: {str(e)}")
+            if strict:
+                raise
             return ""
 
-    def load_document(self, file_path: str) -> List[Dict[str, str]]:
-        """加载单个文档，PDF和PPT按页/幻灯片分割，返回文档块列表"""
+    def is_streamed(self, file_path: str) -> bool:
+        """判断文件是否需要流式处理（超大TXT文件）"""
         ext = os.path.splitext(file_path)[1].lower()
-        filename = os.path.basename(file_path)
+        return ext == ".txt" and os.path.getsize(file_path) > TXT_STREAM_THRESHOLD
+
+    def detect_txt_encoding(self, file_path: str) -> str:
+        """根据文件开头的样本检测TXT文件编码：样本是合法UTF-8时返回utf-8，否则返回gbk
+
+        只读取 TXT_ENCODING_SAMPLE_SIZE 字节。样本之后才出现的非UTF-8字节不会被检测到，
+        这种情况下 iter_txt 会在读到该处时抛出 UnicodeDecodeError，由调用方改用GBK重新读取，
+        见 txt_encodings。
+        """
+        with open(file_path, "rb") as f:
+            sample = f.read(TXT_ENCODING_SAMPLE_SIZE)
+            at_end = not f.read(1)
+
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        try:
+            # 样本末尾可能截断了多字节字符，只有读到文件末尾时才要求完整
+            decoder.decode(sample, final=at_end)
+            return "utf-8"
+        except UnicodeDecodeError:
+            return "gbk"
+
+    def txt_encodings(self, file_path: str) -> List[str]:
+        """流式读取TXT文件时依次尝试的编码
+
+        样本检测为UTF-8时，文件后部仍可能是GBK（例如开头是英文的GBK文件），
+        此时读取中途会抛出 UnicodeDecodeError，调用方应丢弃已写入的部分并改用GBK从头重新读取，
+        与load_txt的回退行为一致。
+        """
+        encoding = self.detect_txt_encoding(file_path)
+        return [encoding, "gbk"] if encoding == "utf-8" else [encoding]
+
+    def iter_txt(
+        self, file_path: str, block_size: int = TXT_STREAM_BLOCK_SIZE, encoding: Optional[str] = None
+    ) -> Iterator[str]:
+        """按块读取TXT文件，内容与load_txt相同，未指定编码时根据样本检测
+
+        读取出错时直接抛出异常，由调用方处理，避免文件被截断后当作完整内容导入。
+        """
+        if encoding is None:
+            encoding = self.detect_txt_encoding(file_path)
+        with open(file_path, "r", encoding=encoding) as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    return
+                yield block
+
+    def list_files(self) -> List[str]:
+        """列出数据目录下所有支持格式的文件"""
+        file_paths = []
+        for root, dirs, files in os.walk(self.data_dir):
+            for file in files:
+                ext = os.path.splitext(file)[1].lower()
+                if ext in self.supported_formats:
+                    file_paths.append(os.path.join(root, file))
+        return file_paths
+
+    def load_document(self, file_path: str, strict: bool = False) -> List[Chunk]:
+        """加载单个文档，PDF和PPT按页/幻灯片分割，返回文档块列表
+
+        默认出错时打印错误并返回空列表；strict为True时直接抛出，
+        供监听模式区分"读取失败"和"文件确实为空"。
+        """
+        ext = os.path.splitext(file_path)[1].lower()
+        file_info = get_file_info(file_path)
         documents = []
 
         if ext == ".pdf":
-            pages = self.load_pdf(file_path)
+            pages = self.load_pdf(file_path, strict=strict)
             for page_idx, page_data in enumerate(pages, 1):
                 documents.append(
-                    {
-                        "content": page_data["text"],
-                        "filename": filename,
-                        "filepath": file_path,
-                        "filetype": ext,
-                        "page_number": page_idx,
-                    }
+                    Chunk(content=page_data["text"], file=file_info, page_number=page_idx)
                 )
         elif ext == ".pptx":
-            slides = self.load_pptx(file_path)
+            slides = self.load_pptx(file_path, strict=strict)
             for slide_idx, slide_data in enumerate(slides, 1):
                 documents.append(
-                    {
-                        "content": slide_data["text"],
-                        "filename": filename,
-                        "filepath": file_path,
-                        "filetype": ext,
-                        "page_number": slide_idx,
-                    }
+                    Chunk(content=slide_data["text"], file=file_info, page_number=slide_idx)
                 )
         elif ext == ".docx":
-            content = self.load_docx(file_path)
+            content = self.load_docx(file_path, strict=strict)
             if content:
-                documents.append(
-                    {
-                        "content": content,
-                        "filename": filename,
-                        "filepath": file_path,
-                        "filetype": ext,
-                        "page_number": 0,
-                    }
-                )
+                documents.append(Chunk(content=content, file=file_info, page_number=0))
         elif ext == ".txt":
-            content = self.load_txt(file_path)
+            content = self.load_txt(file_path, strict=strict)
             if content:
-                documents.append(
-                    {
-                        "content": content,
-                        "filename": filename,
-                        "filepath": file_path,
-                        "filetype": ext,
-                        "page_number": 0,
-                    }
-                )
+                documents.append(Chunk(content=content, file=file_info, page_number=0))
         else:
             print(f"不支持的文件格式: {ext}")
 
         return documents
 
-    def load_all_documents(self) -> List[Dict[str, str]]:
+    def load_all_documents(self) -> List[Chunk]:
         """加载数据目录下的所有文档"""
         if not os.path.exists(self.data_dir):
             print(f"数据目录不存在: {self.data_dir}")
@@ -153,15 +201,15 @@ class DocumentLoader:
 
         documents = []
 
-        for root, dirs, files in os.walk(self.data_dir):
-            for file in files:
-                ext = os.path.splitext(file)[1].lower()
-                if ext in self.supported_formats:
-                    file_path = os.path.join(root, file)
-                    print(f"正在加载: {file_path}")
-                    doc_chunks = self.load_document(file_path)
-                    if doc_chunks:
-                        documents.extend(doc_chunks)
+        for file_path in self.list_files():
+            if self.is_streamed(file_path):
+                # 超大TXT文件由调用方通过iter_txt流式处理
+                print(f"跳过超大TXT文件（将流式处理）: {file_path}")
+                continue
+            print(f"正在加载: {file_path}")
+            doc_chunks = self.load_document(file_path)
+            if doc_chunks:
+                documents.extend(doc_chunks)
 
         print(f"共加载 {len(documents)} 个文档块")
         return documents
\ No newline at end of file
@@ -0,0 +1,154 @@
+import os
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+
+def file_signature(file_path: str) -> Optional[Tuple[int, int]]:
+    """文件签名：(修改时间, 文件大小)，文件不存在时返回None"""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class FileStateTable:
+    """记录已导入文件的签名，用于判断文件在离线期间是否被修改"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Dict[str, Tuple[int, int]]:
+        """读取 文件路径 -> 签名"""
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return {file_path: tuple(signature) for file_path, signature in json.load(f).items()}
+
+    def _save(self, states: Dict[str, Tuple[int, int]]) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({file_path: list(signature) for file_path, signature in states.items()}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def update(self, signatures: Dict[str, Optional[Tuple[int, int]]]) -> None:
+        """批量更新签名，签名为None表示文件已移除"""
+        states = self.load()
+        for file_path, signature in signatures.items():
+            if signature is None:
+                states.pop(file_path, None)
+            else:
+                states[file_path] = signature
+        self._save(states)
+
+    def reset(self) -> None:
+        """清空文件签名记录"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class IngestCheckpoint:
+    """记录已写入向量数据库的块ID，每行一个，追加写入"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Set[str]:
+        """读取已提交的块ID"""
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, "r", encoding="utf-8") as f:
+            return {line.rstrip("\n") for line in f if line.strip()}
+
+    def mark_committed(self, chunk_id: str) -> None:
+        """追加一个已提交的块ID，并立即落盘"""
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(chunk_id + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def discard(self, chunk_ids: Set[str]) -> None:
+        """从检查点中移除一批块ID（文件被删除或替换时使用）"""
+        committed = self.load()
+        if not committed & chunk_ids:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for chunk_id in committed - chunk_ids:
+                f.write(chunk_id + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def reset(self) -> None:
+        """清空检查点"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class DeadLetterQueue:
+    """保存多次重试仍失败的块，供之后重放，同一块ID只记录一次"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._ids: Optional[Set[str]] = None
+
+    def _make_entry(self, chunk_id: str, chunk: Dict, error: str) -> Dict:
+        return {
+            "id": chunk_id,
+            "chunk": chunk,
+            "error": error,
+            "failed_at": datetime.now().isoformat(timespec="seconds"),
+        }
+
+    def ids(self) -> Set[str]:
+        """死信文件中已有的块ID"""
+        if self._ids is None:
+            self._ids = {entry["id"] for entry in self.load_entries() if entry.get("id")}
+        return self._ids
+
+    def append(self, chunk_id: str, chunk: Dict, error: str) -> None:
+        """记录一个失败的块，已在死信文件中的块不重复记录"""
+        if chunk_id in self.ids():
+            return
+        entry = self._make_entry(chunk_id, chunk, error)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._ids.add(chunk_id)
+
+    def load_entries(self) -> List[Dict]:
+        """读取所有死信记录"""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def load(self) -> List[Dict]:
+        """读取所有失败的块"""
+        return [entry["chunk"] for entry in self.load_entries()]
+
+    def rewrite(self, failures: List[Tuple[str, Dict, str]]) -> None:
+        """用 (块ID, 块, 错误) 列表原子地替换死信文件，列表为空时删除文件"""
+        if not failures:
+            self.reset()
+            return
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for chunk_id, chunk, error in failures:
+                f.write(json.dumps(self._make_entry(chunk_id, chunk, error), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._ids = {chunk_id for chunk_id, _, _ in failures}
+
+    def reset(self) -> None:
+        """清空死信文件"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._ids = set()
@@ -1,22 +1,43 @@
 import os
+import argparse
 from rag_agent import RAGAgent
+from document_loader import DocumentLoader
+from text_splitter import TextSplitter
+from watcher import DocumentWatcher
 
-from config import VECTOR_DB_PATH, MODEL_NAME
+from config import VECTOR_DB_PATH, MODEL_NAME, DATA_DIR, CHUNK_SIZE, CHUNK_OVERLAP
 
 
 def main():
+    parser = argparse.ArgumentParser(description="智能课程助教")
+    parser.add_argument("--watch", action="store_true", help="监听数据目录，在后台同步新增、修改、删除的文件")
+    args = parser.parse_args()
 
-    if not os.path.exists(VECTOR_DB_PATH):
+    if not os.path.exists(VECTOR_DB_PATH) and not args.watch:
         return
     # 初始化RAG Agent
     agent = RAGAgent(model=MODEL_NAME)
 
-    # 检查知识库
+    # 检查知识库（监听模式下允许从空知识库开始）
     count = agent.vector_store.get_collection_count()
-    if count == 0:
+    if count == 0 and not args.watch:
         return
 
-    agent.chat()
+    watcher = None
+    if args.watch:
+        watcher = DocumentWatcher(
+            agent.vector_store,
+            DocumentLoader(data_dir=DATA_DIR),
+            TextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP),
+            data_dir=DATA_DIR,
+        )
+        watcher.start()
+
+    try:
+        agent.chat()
+    finally:
+        if watcher is not None:
+            watcher.stop()
 
 
 if __name__ == "__main__":
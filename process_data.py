@@ -1,12 +1,25 @@
 import os
+import argparse
 from document_loader import DocumentLoader
 from text_splitter import TextSplitter
 from vector_store import VectorStore
+from chunk_record import get_file_info
+from ingest_state import file_signature
 
 from config import DATA_DIR, CHUNK_SIZE, CHUNK_OVERLAP, VECTOR_DB_PATH
 
 
 def main():
+    parser = argparse.ArgumentParser(description="处理课程文档并写入向量数据库")
+    parser.add_argument("--resume", action="store_true", help="从上次中断处继续导入，不清空向量数据库")
+    parser.add_argument("--replay-dead-letter", action="store_true", help="重新导入死信文件中失败的文档块")
+    args = parser.parse_args()
+
+    if args.replay_dead_letter:
+        vector_store = VectorStore(db_path=VECTOR_DB_PATH)
+        vector_store.replay_dead_letter()
+        return
+
     if not os.path.exists(DATA_DIR):
         print(f"数据目录不存在: {DATA_DIR}")
         print("请创建数据目录并放入PDF、PPTX、DOCX或TXT文件")
@@ -18,11 +31,16 @@ def main():
     )
     splitter = TextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
     vector_store = VectorStore(db_path=VECTOR_DB_PATH)
-    vector_store.clear_collection()
+    if not args.resume:
+        vector_store.clear_collection()
+
+    # 记录导入前的文件签名，供监听模式判断离线期间的修改
+    signatures = {path: file_signature(path) for path in loader.list_files()}
 
     # 加载文档
     documents = loader.load_all_documents()
-    if not documents:
+    streamed_files = [path for path in loader.list_files() if loader.is_streamed(path)]
+    if not documents and not streamed_files:
         print("未找到任何文档")
         return
 
@@ -30,7 +48,36 @@ def main():
     chunks = splitter.split_documents(documents)
 
     # 存储到向量数据库
-    vector_store.add_documents(chunks)
+    vector_store.add_documents(chunks, resume=args.resume)
+
+    # 超大TXT文件边读取边切分边写入，内存占用与文件大小无关
+    for file_path in streamed_files:
+        print(f"正在流式处理: {file_path}")
+        encodings = loader.txt_encodings(file_path)
+        for attempt, encoding in enumerate(encodings):
+            stream = splitter.split_document_stream(
+                loader.iter_txt(file_path, encoding=encoding), get_file_info(file_path)
+            )
+            try:
+                vector_store.add_documents(stream, resume=args.resume and attempt == 0)
+                break
+            except UnicodeDecodeError as e:
+                # 读取中途出错时移除已写入的部分，避免把截断的文件当作完整内容
+                vector_store.remove_file(file_path)
+                if attempt + 1 < len(encodings):
+                    print(f"按 {encoding} 解码失败，改用 {encodings[attempt + 1]} 重新处理: {file_path}")
+                    continue
+                print(f"流式处理失败（编码无法识别）: {file_path}, 错误: {str(e)}")
+                print("已移除该文件已写入的文档块，请修复文件后重新运行")
+                signatures.pop(file_path, None)
+            except Exception as e:
+                print(f"流式处理失败: {file_path}, 错误: {str(e)}")
+                print("已移除该文件已写入的文档块，请修复文件后重新运行")
+                vector_store.remove_file(file_path)
+                signatures.pop(file_path, None)
+                break
+
+    vector_store.file_state.update(signatures)
     
     print("\n数据处理完成！可以运行main.py开始对话")
 
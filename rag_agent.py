@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional, Tuple
 
 from openai import OpenAI
@@ -7,8 +8,12 @@ from config import (
     OPENAI_API_BASE,
     MODEL_NAME,
     TOP_K,
+    ANSWER_MAX_WORKERS,
 )
 from vector_store import VectorStore
+from conversation_memory import ConversationMemory
+from rate_limiter import get_rate_limiter, estimate_tokens, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from single_flight import SingleFlight
 
 
 class RAGAgent:
@@ -18,10 +23,14 @@ class RAGAgent:
     ):
         self.model = model
 
-        self.client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_API_BASE)
+        # 重试由共享限流器负责
+        self.client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_API_BASE, max_retries=0)
 
         self.vector_store = VectorStore()
 
+        # 合并相同问题的并发请求
+        self._single_flight = SingleFlight()
+
         # 系统提示词 - 定义助教的角色
         self.system_prompt = """你是一位专业、耐心、严谨的课程助教。你的任务是帮助学生理解课程内容，解答学习中的疑问。
 
@@ -42,10 +51,14 @@ class RAGAgent:
         # 1. 使用向量数据库检索相关文档
         retrieved_docs = self.vector_store.search(query, top_k=top_k)
         
+        # 2. 格式化检索结果，构建上下文字符串
+        return self.format_context(retrieved_docs), retrieved_docs
+
+    def format_context(self, retrieved_docs: List[Dict]) -> str:
+        """将检索结果格式化为上下文字符串"""
         if not retrieved_docs:
-            return "（未检索到相关课程材料）", []
+            return "（未检索到相关课程材料）"
         
-        # 2. 格式化检索结果，构建上下文字符串
         context_parts = ["检索到的相关课程内容：\n"]
         
         for i, doc in enumerate(retrieved_docs):
@@ -62,17 +75,26 @@ class RAGAgent:
             context_part = f"\n【{i+1}】{source_info}\n{content}\n"
             context_parts.append(context_part)
         
-        context_str = "\n".join(context_parts)
-        
-        return context_str, retrieved_docs
+        return "\n".join(context_parts)
 
     def generate_response(
         self,
         query: str,
         context: str,
         chat_history: Optional[List[Dict]] = None,
+        priority: int = PRIORITY_INTERACTIVE,
     ) -> str:
         """生成回答"""
+        return self._generate(query, context, chat_history, priority)[0]
+
+    def _generate(
+        self,
+        query: str,
+        context: str,
+        chat_history: Optional[List[Dict]],
+        priority: int,
+    ) -> Tuple[str, int]:
+        """生成回答，同时返回本次提示词的token数（接口未返回用量时为估计值）"""
         messages = [{"role": "system", "content": self.system_prompt}]
 
         if chat_history:
@@ -95,35 +117,120 @@ class RAGAgent:
 
         messages.append({"role": "user", "content": user_text})
         
+        prompt_text = "".join(message["content"] for message in messages)
+
         try:
-            response = self.client.chat.completions.create(
-                model=self.model, 
-                messages=messages, 
-                temperature=0.7, 
-                max_tokens=1500
+            response = get_rate_limiter().call(
+                lambda: self.client.chat.completions.create(
+                    model=self.model, 
+                    messages=messages, 
+                    temperature=0.7, 
+                    max_tokens=1500
+                ),
+                estimated_tokens=estimate_tokens(prompt_text) + 1500,
+                priority=priority,
             )
 
-            return response.choices[0].message.content
+            usage = getattr(response, "usage", None)
+            prompt_tokens = getattr(usage, "prompt_tokens", None) or estimate_tokens(prompt_text)
+            return response.choices[0].message.content, prompt_tokens
         except Exception as e:
-            return f"生成回答时出错: {str(e)}"
+            return f"生成回答时出错: {str(e)}", estimate_tokens(prompt_text)
 
     def answer_question(
-        self, query: str, chat_history: Optional[List[Dict]] = None, top_k: int = TOP_K
+        self,
+        query: str,
+        chat_history: Optional[List[Dict]] = None,
+        top_k: int = TOP_K,
+    ) -> Dict[str, any]:
+        """回答问题
+
+        没有对话历史时，相同问题的并发请求只检索和生成一次，所有调用共享结果。
+        """
+        if chat_history:
+            return self._answer_question(query, chat_history, top_k)
+
+        key = (" ".join(query.split()), top_k)
+        result = self._single_flight.do(
+            key, lambda: self._answer_question(query, None, top_k)
+        )
+        return dict(result)
+
+    def get_coalescing_stats(self) -> Dict[str, int]:
+        """请求合并统计：每次合并省下一次embedding、一次向量检索和一次对话生成"""
+        stats = self._single_flight.stats
+        return {
+            "executed": stats["executed"],
+            "coalesced": stats["coalesced"],
+            "saved_embedding_calls": stats["coalesced"],
+            "saved_vector_queries": stats["coalesced"],
+            "saved_completion_calls": stats["coalesced"],
+        }
+
+    def _answer_question(
+        self,
+        query: str,
+        chat_history: Optional[List[Dict]],
+        top_k: int,
     ) -> Dict[str, any]:
-        """回答问题"""
         context, retrieved_docs = self.retrieve_context(query, top_k=top_k)
 
         if not context or context == "（未检索到相关课程材料）":
             context = "（未检索到特别相关的课程材料）"
 
-        answer = self.generate_response(query, context, chat_history)
+        answer, prompt_tokens = self._generate(query, context, chat_history, PRIORITY_INTERACTIVE)
 
         return {
             "answer": answer,
             "context": context,
-            "retrieved_docs": retrieved_docs
+            "retrieved_docs": retrieved_docs,
+            "prompt_tokens": prompt_tokens
         }
 
+    def search_many(
+        self, queries: List[str], top_k: int = TOP_K
+    ) -> List[Optional[Tuple[str, List[Dict]]]]:
+        """批量检索多个问题的上下文，返回结果与输入顺序一致，检索失败的问题为None"""
+        all_docs = self.vector_store.search_many(queries, top_k=top_k)
+        return [None if docs is None else (self.format_context(docs), docs) for docs in all_docs]
+
+    def answer_questions(
+        self, queries: List[str], top_k: int = TOP_K, max_workers: int = ANSWER_MAX_WORKERS
+    ) -> List[Dict[str, any]]:
+        """批量回答问题（无对话历史）
+
+        所有问题的embedding批量获取、检索合并为一次多向量查询，
+        回答以有限并发生成，返回结果与输入顺序一致。
+        检索失败的问题不调用对话接口，结果中带有error字段。
+        """
+        retrieved = self.search_many(queries, top_k=top_k)
+
+        def answer(index: int) -> Dict[str, any]:
+            if retrieved[index] is None:
+                return {
+                    "answer": "",
+                    "context": "",
+                    "retrieved_docs": [],
+                    "prompt_tokens": 0,
+                    "error": "检索失败，未生成回答"
+                }
+
+            context, retrieved_docs = retrieved[index]
+            if not context or context == "（未检索到相关课程材料）":
+                context = "（未检索到特别相关的课程材料）"
+
+            answer, prompt_tokens = self._generate(queries[index], context, None, PRIORITY_BULK)
+
+            return {
+                "answer": answer,
+                "context": context,
+                "retrieved_docs": retrieved_docs,
+                "prompt_tokens": prompt_tokens
+            }
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(answer, range(len(queries))))
+
     def chat(self) -> None:
         """交互式对话"""
         print("=" * 60)
@@ -136,7 +243,8 @@ class RAGAgent:
         print("4. 输入 '退出' 或 'quit' 结束对话")
         print("=" * 60)
 
-        chat_history = []
+        # 带token预算的对话记忆，较早的对话在后台压缩为摘要
+        memory = ConversationMemory(self.client, self.model)
 
         while True:
             try:
@@ -150,7 +258,7 @@ class RAGAgent:
                     break
 
                 print("助教: 正在思考...")
-                result = self.answer_question(query, chat_history=chat_history)
+                result = self.answer_question(query, chat_history=memory.messages())
                 answer = result["answer"]
                 
                 print(f"\n助教: {answer}")
@@ -167,15 +275,14 @@ class RAGAgent:
                             source += f" 第{page_num}页"
                         print(f"- {source}")
 
-                chat_history.append({"role": "user", "content": query})
-                chat_history.append({"role": "assistant", "content": answer})
-                
-                # 限制历史记录长度
-                if len(chat_history) > 10:  # 保留最近5轮对话
-                    chat_history = chat_history[-10:]
+                print(f"\n（本轮提示词 {result['prompt_tokens']} tokens）")
+
+                memory.add_turn(query, answer)
 
             except KeyboardInterrupt:
                 print("\n\n助教: 对话结束，祝你学习顺利！")
                 break
             except Exception as e:
-                print(f"\n错误: {str(e)}")
\ No newline at end of file
+                print(f"\n错误: {str(e)}")
+
+        memory.close()
\ No newline at end of file
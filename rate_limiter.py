@@ -0,0 +1,192 @@
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional, TypeVar
+
+from openai import RateLimitError, APIConnectionError, InternalServerError
+
+from config import (
+    RATE_LIMIT_REQUESTS_PER_MINUTE,
+    RATE_LIMIT_TOKENS_PER_MINUTE,
+    RATE_LIMIT_MAX_RETRIES,
+)
+
+T = TypeVar("T")
+
+# 请求优先级：交互式问答优先于批量导入/评估
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计文本的token数量（1个token ≈ 2个中文字符，偏保守）"""
+    return len(text) // 2 + 1
+
+
+class RateLimiter:
+    """进程内共享的令牌桶限流器，同时限制每分钟请求数和token数
+
+    收到429时按Retry-After暂停所有请求并降低速率，之后随成功请求逐步恢复。
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = RATE_LIMIT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = RATE_LIMIT_TOKENS_PER_MINUTE,
+        max_retries: int = RATE_LIMIT_MAX_RETRIES,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+
+        # 桶容量为一分钟的额度，初始为满
+        self._request_bucket = float(requests_per_minute)
+        self._token_bucket = float(tokens_per_minute)
+        self._last_refill = time.monotonic()
+
+        # 自适应速率系数，收到429时减半，成功时缓慢恢复
+        self._rate_factor = 1.0
+        self._paused_until = 0.0
+        self._interactive_waiting = 0
+
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_bucket = min(
+            float(self.requests_per_minute),
+            self._request_bucket + elapsed * self.requests_per_minute / 60 * self._rate_factor,
+        )
+        self._token_bucket = min(
+            float(self.tokens_per_minute),
+            self._token_bucket + elapsed * self.tokens_per_minute / 60 * self._rate_factor,
+        )
+
+    def acquire(self, tokens: int, priority: int = PRIORITY_INTERACTIVE) -> None:
+        """阻塞直到可以发出一个消耗tokens个token的请求"""
+        # 超过桶容量的请求最多等到桶满
+        tokens = min(tokens, self.tokens_per_minute)
+
+        with self._cond:
+            if priority == PRIORITY_INTERACTIVE:
+                self._interactive_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+
+                    if now < self._paused_until:
+                        self._cond.wait(self._paused_until - now)
+                        continue
+
+                    if priority == PRIORITY_BULK and self._interactive_waiting:
+                        # 让出额度给交互式请求
+                        self._cond.wait(0.1)
+                        continue
+
+                    if self._request_bucket >= 1 and self._token_bucket >= tokens:
+                        self._request_bucket -= 1
+                        self._token_bucket -= tokens
+                        return
+
+                    # 计算额度恢复所需的时间
+                    request_rate = self.requests_per_minute / 60 * self._rate_factor
+                    token_rate = self.tokens_per_minute / 60 * self._rate_factor
+                    wait = max(
+                        (1 - self._request_bucket) / request_rate,
+                        (tokens - self._token_bucket) / token_rate,
+                        0.01,
+                    )
+                    self._cond.wait(wait)
+            finally:
+                if priority == PRIORITY_INTERACTIVE:
+                    self._interactive_waiting -= 1
+                    self._cond.notify_all()
+
+    def _on_success(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        with self._cond:
+            # 用实际用量修正预估，差额可以让桶暂时为负
+            if actual_tokens is not None:
+                self._token_bucket -= actual_tokens - min(estimated_tokens, self.tokens_per_minute)
+            self._rate_factor = min(1.0, self._rate_factor + 0.05)
+
+    def _on_rate_limited(self, retry_after: Optional[float], attempt: int) -> float:
+        with self._cond:
+            self._rate_factor = max(0.1, self._rate_factor / 2)
+            if retry_after is None:
+                retry_after = min(2 ** attempt, 30) * random.uniform(0.5, 1.0)
+            # 暂停所有请求，并清空已积累的额度，避免恢复后立即再次触发429
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._request_bucket = min(self._request_bucket, 0.0)
+            self._token_bucket = min(self._token_bucket, 0.0)
+            self._cond.notify_all()
+            return retry_after
+
+    def call(
+        self,
+        fn: Callable[[], T],
+        estimated_tokens: int,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> T:
+        """在限流下调用fn，遇到429或临时性错误时重试"""
+        for attempt in range(self.max_retries + 1):
+            self.acquire(estimated_tokens, priority)
+            try:
+                result = fn()
+            except RateLimitError as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._on_rate_limited(_parse_retry_after(e), attempt)
+                print(f"触发限流（429），{delay:.1f}秒后重试")
+                continue
+            except (APIConnectionError, InternalServerError) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = min(2 ** attempt, 30) * random.uniform(0.5, 1.0)
+                print(f"接口调用失败: {str(e)}，{delay:.1f}秒后重试")
+                time.sleep(delay)
+                continue
+
+            usage = getattr(result, "usage", None)
+            self._on_success(estimated_tokens, getattr(usage, "total_tokens", None))
+            return result
+
+
+def _parse_retry_after(error: RateLimitError) -> Optional[float]:
+    """从429响应头中解析等待秒数"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return None
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """获取进程内共享的限流器"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
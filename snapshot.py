@@ -0,0 +1,232 @@
+import os
+import json
+import argparse
+from itertools import islice
+from typing import Dict, Iterator, List
+
+import numpy as np
+from tqdm import tqdm
+
+from vector_store import VectorStore
+from config import (
+    VECTOR_DB_PATH,
+    OPENAI_EMBEDDING_MODEL,
+    SNAPSHOT_DIR,
+    SNAPSHOT_BATCH_SIZE,
+    SNAPSHOT_DTYPE,
+)
+
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+RECORDS_FILE = "records.jsonl"
+SNAPSHOT_VERSION = 1
+
+
+def export_snapshot(
+    vector_store: VectorStore,
+    snapshot_dir: str = SNAPSHOT_DIR,
+    batch_size: int = SNAPSHOT_BATCH_SIZE,
+    dtype: str = SNAPSHOT_DTYPE,
+) -> Dict:
+    """将collection导出为快照：向量写入.npy，id/文本/元数据写入JSONL
+
+    数据文件先写入临时路径，完成后再改名到位，清单最后写入；
+    导出中途失败时快照目录中没有清单，不会被误当作完整快照导入。
+    """
+    if dtype not in ("float32", "float16"):
+        raise ValueError(f"不支持的向量精度: {dtype}")
+
+    collection = vector_store.collection
+    total = collection.count()
+    if total == 0:
+        print("向量数据库为空，无需导出")
+        return {}
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    embeddings_path = os.path.join(snapshot_dir, EMBEDDINGS_FILE)
+    records_path = os.path.join(snapshot_dir, RECORDS_FILE)
+    manifest_path = os.path.join(snapshot_dir, MANIFEST_FILE)
+    # 先移除旧清单，避免旧清单与写了一半的新数据文件配对
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    embeddings_tmp_path = embeddings_path + ".tmp"
+    records_tmp_path = records_path + ".tmp"
+
+    # 向量矩阵在拿到第一批数据、确定维度后再创建，按批写入内存映射文件
+    matrix = None
+    dimension = 0
+    written = 0
+
+    with open(records_tmp_path, "w", encoding="utf-8") as records_file, tqdm(
+        total=total, desc="导出快照", unit="块"
+    ) as progress:
+        for offset in range(0, total, batch_size):
+            batch = collection.get(
+                limit=batch_size,
+                offset=offset,
+                include=["embeddings", "documents", "metadatas"],
+            )
+            ids = batch["ids"]
+            if not ids:
+                break
+
+            vectors = np.asarray(batch["embeddings"], dtype=np.float32)
+            if matrix is None:
+                dimension = vectors.shape[1]
+                matrix = np.lib.format.open_memmap(
+                    embeddings_tmp_path, mode="w+", dtype=dtype, shape=(total, dimension)
+                )
+
+            matrix[written:written + len(ids)] = vectors.astype(dtype)
+
+            for chunk_id, document, metadata in zip(
+                ids, batch["documents"], batch["metadatas"]
+            ):
+                record = {"id": chunk_id, "document": document, "metadata": metadata}
+                records_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+            written += len(ids)
+            progress.update(len(ids))
+
+        records_file.flush()
+        os.fsync(records_file.fileno())
+
+    if matrix is not None:
+        matrix.flush()
+        del matrix
+
+    if written != total:
+        # 导出期间collection发生变化，快照不完整
+        raise RuntimeError(f"导出数量不一致: 预期 {total}，实际 {written}")
+
+    os.replace(embeddings_tmp_path, embeddings_path)
+    os.replace(records_tmp_path, records_path)
+
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "collection_name": vector_store.collection_name,
+        "embedding_model": OPENAI_EMBEDDING_MODEL,
+        "dimension": dimension,
+        "dtype": dtype,
+        "count": written,
+    }
+    manifest_tmp_path = manifest_path + ".tmp"
+    with open(manifest_tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(manifest_tmp_path, manifest_path)
+
+    print(f"快照导出完成: {written} 个文档块 -> {snapshot_dir}")
+    return manifest
+
+
+def load_manifest(snapshot_dir: str = SNAPSHOT_DIR) -> Dict:
+    """读取快照清单"""
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _iter_records(records_path: str) -> Iterator[Dict]:
+    """逐行读取快照记录"""
+    with open(records_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _count_records(records_path: str) -> int:
+    """逐行校验快照记录并计数，不保留记录内容"""
+    count = 0
+    for record in _iter_records(records_path):
+        if not all(key in record for key in ("id", "document", "metadata")):
+            raise ValueError(f"快照记录格式错误（第 {count + 1} 条）")
+        count += 1
+    return count
+
+
+def import_snapshot(
+    vector_store: VectorStore,
+    snapshot_dir: str = SNAPSHOT_DIR,
+    batch_size: int = SNAPSHOT_BATCH_SIZE,
+) -> int:
+    """从快照恢复collection，按批流式写入，不调用embedding接口
+
+    清空现有collection之前先完整校验记录文件，记录数与清单不一致时现有索引保持不变。
+    """
+    manifest = load_manifest(snapshot_dir)
+
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"不支持的快照版本: {manifest.get('version')}")
+
+    if manifest.get("embedding_model") != OPENAI_EMBEDDING_MODEL:
+        # 查询时使用的embedding模型与快照不一致，检索结果将没有意义
+        raise ValueError(
+            f"快照的embedding模型 {manifest.get('embedding_model')} "
+            f"与当前配置 {OPENAI_EMBEDDING_MODEL} 不一致"
+        )
+
+    total = manifest["count"]
+    # 以内存映射方式读取向量，只有当前批次会被载入内存
+    matrix = np.load(os.path.join(snapshot_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    if matrix.shape != (total, manifest["dimension"]):
+        raise ValueError(f"向量文件形状 {matrix.shape} 与清单不一致")
+
+    records_path = os.path.join(snapshot_dir, RECORDS_FILE)
+    record_count = _count_records(records_path)
+    if record_count != total:
+        raise ValueError(f"快照记录数量不一致: 预期 {total}，实际 {record_count}")
+
+    vector_store.clear_collection()
+
+    records = _iter_records(records_path)
+    imported = 0
+
+    with tqdm(total=total, desc="导入快照", unit="块") as progress:
+        while True:
+            batch: List[Dict] = list(islice(records, batch_size))
+            if not batch:
+                break
+
+            vectors = np.asarray(
+                matrix[imported:imported + len(batch)], dtype=np.float32
+            )
+            vector_store.collection.add(
+                ids=[record["id"] for record in batch],
+                documents=[record["document"] for record in batch],
+                metadatas=[record["metadata"] for record in batch],
+                embeddings=vectors.tolist(),
+            )
+
+            imported += len(batch)
+            progress.update(len(batch))
+
+    if imported != total:
+        raise ValueError(f"快照记录数量不一致: 预期 {total}，实际 {imported}")
+
+    print(f"快照导入完成: {imported} 个文档块 -> {vector_store.db_path}")
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出或导入向量数据库快照")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR, help="快照目录")
+    parser.add_argument("--db-path", default=VECTOR_DB_PATH, help="向量数据库目录")
+    parser.add_argument("--batch-size", type=int, default=SNAPSHOT_BATCH_SIZE)
+    parser.add_argument(
+        "--dtype", choices=["float32", "float16"], default=SNAPSHOT_DTYPE,
+        help="导出时的向量精度"
+    )
+    args = parser.parse_args()
+
+    vector_store = VectorStore(db_path=args.db_path)
+
+    if args.command == "export":
+        export_snapshot(vector_store, args.snapshot_dir, args.batch_size, args.dtype)
+    else:
+        import_snapshot(vector_store, args.snapshot_dir, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
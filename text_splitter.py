@@ -1,6 +1,8 @@
-from typing import List, Dict
+from typing import Iterable, Iterator, List
 from tqdm import tqdm
 
+from chunk_record import Chunk, FileInfo
+
 
 class TextSplitter:
     def __init__(self, chunk_size: int, chunk_overlap: int):
@@ -12,87 +14,112 @@ class TextSplitter:
         if not text:
             return []
 
+        return list(self.split_stream([text]))
+
+    def split_stream(self, blocks: Iterable[str]) -> Iterator[str]:
+        """将按顺序到达的文本片段切分为块，结果与对拼接后的全文调用split_text相同
+
+        只在内存中保留当前块附近的文本，适合超大文件的流式处理。
+        """
         # 计算最大允许的字符数（根据token限制估算）
         # 对于中文，保守估计：1个token ≈ 3个字符
         max_chars_per_chunk = self.chunk_size #默认为500
-        
-        # 如果文本很短，直接返回
-        if len(text) <= max_chars_per_chunk:
-            return [text.strip()] if text.strip() else []
-        
-        chunks = []
+        # 句子边界最多在块结束位置之后100个字符内查找
+        window = max_chars_per_chunk + 100
+
+        blocks = iter(blocks)
+        buffer = ""  # 全文中从offset开始的一段
+        offset = 0
+        eof = False
         start = 0
-        text_length = len(text)
-        
+
         # 句子结束符
         sentence_endings = ['。', '！', '？', '.', '!', '?', '\n\n', '\r\n\r\n']
-        
-        while start < text_length:
+
+        while True:
+            # 读入足够的文本：从start起多于window个字符，或直到末尾
+            while not eof and offset + len(buffer) - start <= window:
+                block = next(blocks, None)
+                if block is None:
+                    eof = True
+                else:
+                    buffer += block
+
+            # 如果文本很短，直接返回
+            if start == 0 and eof and len(buffer) <= max_chars_per_chunk:
+                if buffer.strip():
+                    yield buffer.strip()
+                return
+
+            text_length = offset + len(buffer) if eof else None
+
             # 计算块的结束位置，确保不超过最大长度
-            end = min(start + max_chars_per_chunk, text_length)
-            
+            end = start + max_chars_per_chunk
+            if eof:
+                end = min(end, text_length)
+
             # 如果还没到文本末尾，尝试在句子边界处切分
-            if end < text_length:
+            if not eof or end < text_length:
                 # 查找最接近的句子结束位置
                 for ending in sentence_endings:
                     # 在end附近查找句子结束符
                     search_start = max(start, end - 100)  # 向前搜索100字符
-                    pos = text.rfind(ending, search_start, end + 100)
+                    pos = buffer.rfind(ending, search_start - offset, end + 100 - offset)
                     if pos != -1:
-                        end = pos + len(ending)
+                        end = offset + pos + len(ending)
                         break
-            
-            chunk = text[start:end]
+
+            chunk = buffer[start - offset:end - offset]
             if chunk.strip():  # 只添加非空块
-                chunks.append(chunk.strip())
-            
-            # 更新start位置，考虑重叠
-            start = end - self.chunk_overlap
-            
-            # 确保有进展
-            if start <= end - self.chunk_overlap:
-                start = end - self.chunk_overlap
-            
-            # 防止死循环
-            if start >= end:
-                start = end
-        
-        return chunks
-
-    def split_documents(self, documents: List[Dict[str, str]]) -> List[Dict[str, str]]:
+                yield chunk.strip()
+
+            # 已到文本末尾
+            if eof and end >= text_length:
+                return
+
+            # 更新start位置，考虑重叠，并确保有进展
+            next_start = min(end - self.chunk_overlap, end)
+            start = next_start if next_start > start else end
+
+            # 丢弃已处理的文本，超过一半时才整理，避免反复复制
+            if start - offset > len(buffer) // 2:
+                buffer = buffer[start - offset:]
+                offset = start
+
+    def split_document_stream(self, blocks: Iterable[str], file: FileInfo) -> Iterator[Chunk]:
+        """流式切分单个TXT文件，逐个产出文档块"""
+        for i, chunk in enumerate(self.split_stream(blocks)):
+            yield Chunk(content=chunk, file=file, page_number=0, chunk_id=i)
+
+    def split_documents(self, documents: List[Chunk]) -> List[Chunk]:
         """切分多个文档"""
         chunks_with_metadata = []
 
         for doc in tqdm(documents, desc="处理文档", unit="文档"):
-            content = doc.get("content", "")
-            filetype = doc.get("filetype", "")
+            content = doc.content
+            filetype = doc.filetype
 
             if filetype in [".pdf", ".pptx"]:
                 # PDF和PPT已经按页分割，不再二次切分
-                chunk_data = {
-                    "content": content,
-                    "filename": doc.get("filename", "unknown"),
-                    "filepath": doc.get("filepath", ""),
-                    "filetype": filetype,
-                    "page_number": doc.get("page_number", 0),
-                    "chunk_id": 0,
-                    "images": doc.get("images", []),
-                }
+                chunk_data = Chunk(
+                    content=content,
+                    file=doc.file,
+                    page_number=doc.page_number,
+                    chunk_id=0,
+                    images=doc.images,
+                )
                 chunks_with_metadata.append(chunk_data)
 
             elif filetype in [".docx", ".txt"]:
                 # DOCX和TXT需要进行文本切分
                 chunks = self.split_text(content)
                 for i, chunk in enumerate(chunks):
-                    chunk_data = {
-                        "content": chunk,
-                        "filename": doc.get("filename", "unknown"),
-                        "filepath": doc.get("filepath", ""),
-                        "filetype": filetype,
-                        "page_number": 0,
-                        "chunk_id": i,
-                        "images": [],
-                    }
+                    chunk_data = Chunk(
+                        content=chunk,
+                        file=doc.file,
+                        page_number=0,
+                        chunk_id=i,
+                    )
                     chunks_with_metadata.append(chunk_data)
 
         print(f"\n文档处理完成，共 {len(chunks_with_metadata)} 个块")
@@ -9,12 +9,13 @@ import pandas as pd
 from rag_agent import RAGAgent
 from config import MODEL_NAME, OPENAI_API_KEY, OPENAI_API_BASE
 from openai import OpenAI
+from rate_limiter import get_rate_limiter, estimate_tokens, PRIORITY_BULK
 
 class LLMEvaluator:
     def __init__(self):
         # 初始化你的RAG智能体和用于评估的LLM客户端（使用同一个）
         self.rag_agent = RAGAgent(model=MODEL_NAME)
-        self.eval_client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_API_BASE)
+        self.eval_client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_API_BASE, max_retries=0)
 
         # ！！！核心：请替换成你精心设计的5-10个测试问题 ！！！
         self.test_questions = [
@@ -43,6 +44,15 @@ class LLMEvaluator:
         # contexts = [result.get("context", "")]
         return answer, contexts
 
+    def ask_rag_many(self, questions):
+        """批量调用RAG系统，返回 (答案, 上下文列表, 错误) 列表，顺序与问题一致。"""
+        results = self.rag_agent.answer_questions(questions)
+        outputs = []
+        for result in results:
+            contexts = [doc.get('content', '') for doc in result.get('retrieved_docs') or []]
+            outputs.append((result.get("answer", ""), contexts, result.get("error")))
+        return outputs
+
     def llm_as_judge(self, question, answer, contexts):
         """让LLM作为裁判，对RAG的答案进行评估。"""
         # 将上下文拼接成一个字符串
@@ -81,14 +91,19 @@ class LLMEvaluator:
 """
 
         try:
-            response = self.eval_client.chat.completions.create(
-                model=MODEL_NAME,  # 使用同一个模型进行评估
-                messages=[
-                    {"role": "system", "content": "你是一个公正、严格的评估者，总是输出有效的JSON。"},
-                    {"role": "user", "content": evaluation_prompt}
-                ],
-                temperature=0.1,  # 低温度以保证评估稳定性
-                response_format={"type": "json_object"}  # 要求返回JSON
+            # 评估属于批量任务，与问答共享限流额度但优先级较低
+            response = get_rate_limiter().call(
+                lambda: self.eval_client.chat.completions.create(
+                    model=MODEL_NAME,  # 使用同一个模型进行评估
+                    messages=[
+                        {"role": "system", "content": "你是一个公正、严格的评估者，总是输出有效的JSON。"},
+                        {"role": "user", "content": evaluation_prompt}
+                    ],
+                    temperature=0.1,  # 低温度以保证评估稳定性
+                    response_format={"type": "json_object"}  # 要求返回JSON
+                ),
+                estimated_tokens=estimate_tokens(evaluation_prompt) + 500,
+                priority=PRIORITY_BULK,
             )
             evaluation_result = json.loads(response.choices[0].message.content)
             return evaluation_result
@@ -105,12 +120,21 @@ class LLMEvaluator:
         print("🧪 开始基于LLM的RAG系统评估...")
         all_results = []
 
-        for question in tqdm(self.test_questions, desc="评估进度"):
-            # 1. RAG系统生成答案
-            answer, contexts = self.ask_rag(question)
-
-            # 2. LLM对答案进行评估
-            eval_result = self.llm_as_judge(question, answer, contexts)
+        # 1. RAG系统批量生成答案
+        rag_outputs = self.ask_rag_many(self.test_questions)
+
+        for question, (answer, contexts, error) in tqdm(
+            zip(self.test_questions, rag_outputs), total=len(self.test_questions), desc="评估进度"
+        ):
+            # 2. LLM对答案进行评估（检索失败的问题不评估，也不计入平均分）
+            if error:
+                print(f"跳过评估: {question}（{error}）")
+                eval_result = {
+                    "scores": {"faithfulness": None, "relevancy": None},
+                    "comments": {"faithfulness": error, "relevancy": error}
+                }
+            else:
+                eval_result = self.llm_as_judge(question, answer, contexts)
 
             # 3. 记录结果
             record = {
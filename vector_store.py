@@ -1,5 +1,7 @@
 import os
-from typing import List, Dict
+import time
+from itertools import islice
+from typing import Iterable, List, Dict, Optional, Set, Tuple
 
 import chromadb
 from chromadb.config import Settings
@@ -13,6 +15,22 @@ from config import (
     OPENAI_API_BASE,
     OPENAI_EMBEDDING_MODEL,
     TOP_K,
+    INGEST_CHECKPOINT_FILE,
+    DEAD_LETTER_FILE,
+    FILE_STATE_FILE,
+    WRITE_BATCH_SIZE,
+    DATA_DIR,
+    EMBEDDING_BATCH_SIZE,
+    QUERY_BATCH_SIZE,
+)
+from chunk_record import Chunk
+from ingest_state import IngestCheckpoint, DeadLetterQueue, FileStateTable
+from rw_lock import ReadWriteLock
+from rate_limiter import (
+    get_rate_limiter,
+    estimate_tokens,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_BULK,
 )
 
 
@@ -28,8 +46,14 @@ class VectorStore:
         self.db_path = db_path
         self.collection_name = collection_name
 
-        # 初始化OpenAI客户端
-        self.client = OpenAI(api_key=api_key, base_url=api_base)
+        # 初始化OpenAI客户端（重试由共享限流器负责）
+        self.client = OpenAI(api_key=api_key, base_url=api_base, max_retries=0)
+
+        # 读写锁：检索共享持有，可以并发；切换文件版本和清空时独占持有
+        self._lock = ReadWriteLock()
+        # 正在写入、尚未生效的文件版本号，检索时过滤掉
+        self._pending_generations: Set[int] = set()
+        self._last_generation = 0
 
         # 初始化ChromaDB
         os.makedirs(db_path, exist_ok=True)
@@ -42,83 +66,222 @@ class VectorStore:
             name=collection_name, metadata={"description": "课程材料向量数据库"}
         )
 
-    def get_embedding(self, text: str) -> List[float]:
-        """获取文本的向量表示"""
+        # 单次写入ChromaDB的块数不能超过其最大批量
+        max_batch_size = getattr(self.chroma_client, "get_max_batch_size", None)
+        self.write_batch_size = min(WRITE_BATCH_SIZE, max_batch_size()) if max_batch_size else WRITE_BATCH_SIZE
+
+        # 导入检查点、死信文件和文件签名记录
+        self.checkpoint = IngestCheckpoint(os.path.join(db_path, INGEST_CHECKPOINT_FILE))
+        self.dead_letter = DeadLetterQueue(os.path.join(db_path, DEAD_LETTER_FILE))
+        self.file_state = FileStateTable(os.path.join(db_path, FILE_STATE_FILE))
+
+    def _truncate(self, text: str) -> str:
+        """检查并截断文本长度"""
+        # 对于中文，粗略估计token数量：1个token ≈ 2-3个中文字符
+        # 2048个token ≈ 4000-6000个中文字符
+        max_char_length = 2000  # 安全字符数
+
+        if len(text) > max_char_length:
+            print(f"警告：文本长度 {len(text)} 超过限制，截断至 {max_char_length}")
+            print(text)
+            text = text[:max_char_length]
+        return text
+
+    def _create_embeddings(self, texts: List[str], priority: int) -> List[List[float]]:
+        """请求一批文本的向量
+
+        429和临时性错误由共享限流器统一重试，其他错误（如4xx）直接抛出。
+        """
         try:
-            # 检查并截断文本长度
-            # 对于中文，粗略估计token数量：1个token ≈ 2-3个中文字符
-            # 2048个token ≈ 4000-6000个中文字符
-            max_char_length = 2000  # 安全字符数
-            
-            if len(text) > max_char_length:
-                print(f"警告：文本长度 {len(text)} 超过限制，截断至 {max_char_length}")
-                print(text)
-                text = text[:max_char_length]
-            
-            response = self.client.embeddings.create(
-                model=OPENAI_EMBEDDING_MODEL,
-                input=[text]
+            response = get_rate_limiter().call(
+                lambda: self.client.embeddings.create(
+                    model=OPENAI_EMBEDDING_MODEL,
+                    input=texts
+                ),
+                estimated_tokens=sum(estimate_tokens(text) for text in texts),
+                priority=priority,
             )
-            return response.data[0].embedding
         except Exception as e:
             print(f"获取embedding失败: {str(e)}")
-            print(f"文本长度: {len(text)}")
-            print(f"文本前100字符: {text[:100]}...")
-            # 返回一个默认的零向量
-            return [0.0] * 1536
-    def add_documents(self, chunks: List[Dict[str, str]]) -> None:
-        """添加文档块到向量数据库"""
-        if not chunks:
-            print("没有文档块可添加")
-            return
-        
-        print(f"开始添加 {len(chunks)} 个文档块到向量数据库...")
-        
+            print(f"文本数量: {len(texts)}")
+            print(f"首个文本前100字符: {texts[0][:100]}...")
+            raise
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def get_embedding(self, text: str, priority: int = PRIORITY_INTERACTIVE) -> List[float]:
+        """获取文本的向量表示"""
+        return self._create_embeddings([self._truncate(text)], priority)[0]
+
+    def get_embeddings(
+        self, texts: List[str], priority: int = PRIORITY_INTERACTIVE
+    ) -> List[List[float]]:
+        """批量获取文本的向量表示，按接口允许的最大批量合并请求，结果与输入顺序一致"""
+        texts = [self._truncate(text) for text in texts]
+        embeddings = []
+        for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            embeddings.extend(self._create_embeddings(texts[i:i + EMBEDDING_BATCH_SIZE], priority))
+        return embeddings
+
+    @staticmethod
+    def make_chunk_id(chunk: Chunk, generation: int = 0) -> str:
+        """生成文档块的唯一ID，使用相对于数据目录的路径，不同目录下的同名文件不会冲突
+
+        按文件替换时新块带上版本号，与旧块的ID不冲突。
+        """
+        if not chunk.filepath:
+            chunk_id = f"{chunk.filename}_{chunk.page_number}_{chunk.chunk_id}"
+        else:
+            try:
+                relpath = os.path.relpath(chunk.filepath, DATA_DIR)
+            except ValueError:
+                relpath = chunk.filepath  # Windows下不在同一盘符
+            relpath = relpath.replace(os.sep, "/")
+            chunk_id = f"{relpath}_{chunk.page_number}_{chunk.chunk_id}"
+        return f"{chunk_id}@{generation}" if generation else chunk_id
+
+    @staticmethod
+    def make_metadata(chunk: Chunk, generation: int = 0) -> Dict:
+        """生成文档块的元数据"""
+        return {
+            "filename": chunk.filename,
+            "filepath": chunk.filepath,
+            "filetype": chunk.filetype,
+            "page_number": chunk.page_number,
+            "chunk_id": chunk.chunk_id,
+            "generation": generation,
+        }
+
+    def _visible_filter(self) -> Optional[Dict]:
+        """检索条件：排除正在写入的文件版本，需在读锁内调用"""
+        if not self._pending_generations:
+            return None
+        return {"generation": {"$nin": sorted(self._pending_generations)}}
+
+    def add_documents(self, chunks: Iterable[Chunk], resume: bool = False) -> None:
+        """添加文档块到向量数据库
+
+        每个块写入后记录到检查点；resume为True时跳过检查点中已提交的块和已在死信文件中的块。
+        多次重试仍失败的块写入死信文件，可通过 process_data.py --replay-dead-letter 重放。
+        传入迭代器时逐块处理，不会一次性载入全部文档块。
+        """
+        if isinstance(chunks, list):
+            if not chunks:
+                print("没有文档块可添加")
+                return
+
+            if resume:
+                skipped = self.checkpoint.load() | self.dead_letter.ids()
+                pending = [c for c in chunks if self.make_chunk_id(c) not in skipped]
+                print(f"断点续传：跳过已提交或已在死信文件中的 {len(chunks) - len(pending)} 个文档块，剩余 {len(pending)} 个")
+                chunks = pending
+
+            print(f"开始添加 {len(chunks)} 个文档块到向量数据库...")
+        else:
+            if resume:
+                skipped = self.checkpoint.load() | self.dead_letter.ids()
+                chunks = (c for c in chunks if self.make_chunk_id(c) not in skipped)
+
+            print("开始流式添加文档块到向量数据库...")
+
+        self._add_chunks(chunks, record_failures=True)
+
+    def _add_chunks(self, chunks: Iterable[Chunk], record_failures: bool) -> List[Tuple[str, Chunk, str]]:
+        """逐块写入向量数据库
+
+        record_failures为True时失败的块立即写入死信文件，否则返回 (块ID, 块, 错误) 列表。
+        """
         successful_count = 0
         failed_count = 0
+        failures = []
         
         for i, chunk in enumerate(tqdm(chunks, desc="添加文档", unit="块")):
+            # 生成唯一ID
+            chunk_id = self.make_chunk_id(chunk)
+
             try:
-                # 生成唯一ID
-                chunk_id = f"{chunk['filename']}_{chunk.get('page_number', 0)}_{chunk.get('chunk_id', 0)}"
-                
                 # 获取文本内容
-                content = chunk.get("content", "")
+                content = chunk.content
                 
                 # 获取embedding
-                embedding = self.get_embedding(content)
+                embedding = self.get_embedding(content, priority=PRIORITY_BULK)
                 
                 # 准备元数据
-                metadata = {
-                    "filename": chunk.get("filename", ""),
-                    "filepath": chunk.get("filepath", ""),
-                    "filetype": chunk.get("filetype", ""),
-                    "page_number": chunk.get("page_number", 0),
-                    "chunk_id": chunk.get("chunk_id", 0),
-                }
+                metadata = self.make_metadata(chunk)
                 
-                # 添加到向量数据库
-                self.collection.add(
+                # 添加到向量数据库（使用upsert，崩溃后重放同一块不会产生重复）
+                self.collection.upsert(
                     embeddings=[embedding],
                     documents=[content],
                     metadatas=[metadata],
                     ids=[chunk_id]
                 )
+                self.checkpoint.mark_committed(chunk_id)
                 
                 successful_count += 1
                 
             except Exception as e:
                 failed_count += 1
-                print(f"\n添加文档块失败: {chunk.get('filename', 'unknown')}")
+                print(f"\n添加文档块失败: {chunk.filename}")
                 print(f"错误: {str(e)}")
-                print(f"内容长度: {len(chunk.get('content', ''))}")
-                print(f"跳过此文档块...")
+                print(f"内容长度: {len(chunk.content)}")
+                if record_failures:
+                    print(f"已写入死信文件: {self.dead_letter.path}")
+                    self.dead_letter.append(chunk_id, chunk.to_dict(), str(e))
+                else:
+                    failures.append((chunk_id, chunk, str(e)))
                 continue
         
         print(f"\n文档添加完成:")
         print(f"  成功: {successful_count}")
         print(f"  失败: {failed_count}")
         print(f"  总计: {self.collection.count()}")
+        return failures
+
+    def replay_dead_letter(self) -> None:
+        """重新导入死信文件中的文档块
+
+        重放期间死信文件保持不变；结束后原子地改写为仍然失败的块。
+        中途崩溃后再次重放，已提交的块会被跳过。
+        """
+        chunks = [Chunk.from_dict(data) for data in self.dead_letter.load()]
+        if not chunks:
+            print("死信文件为空，无需重放")
+            return
+
+        committed = self.checkpoint.load()
+        pending = []
+        seen = set()
+        for chunk in chunks:
+            chunk_id = self.make_chunk_id(chunk)
+            if chunk_id not in committed and chunk_id not in seen:
+                seen.add(chunk_id)
+                pending.append(chunk)
+
+        print(f"开始重放 {len(pending)} 个死信文档块...")
+        failures = self._add_chunks(pending, record_failures=False)
+        self.dead_letter.rewrite([
+            (chunk_id, chunk.to_dict(), error) for chunk_id, chunk, error in failures
+        ])
+        print(f"仍然失败: {len(failures)}")
+
+    @staticmethod
+    def _format_results(
+        ids: List[str], documents: List[str], metadatas: List[Dict], distances: List[float]
+    ) -> List[Dict]:
+        """格式化单个查询的检索结果"""
+        formatted_results = []
+
+        for i, (doc_id, doc, metadata, distance) in enumerate(zip(ids, documents, metadatas, distances)):
+            formatted_results.append({
+                "id": doc_id,
+                "content": doc,
+                "metadata": metadata,
+                "score": 1 - distance,  # 将距离转换为相似度分数
+                "index": i
+            })
+
+        return formatted_results
+
     def search(self, query: str, top_k: int = TOP_K) -> List[Dict]:
         """搜索相关文档"""
         try:
@@ -126,44 +289,186 @@ class VectorStore:
             query_embedding = self.get_embedding(query)
             
             # 在向量数据库中搜索
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k,
-                include=["documents", "metadatas", "distances"]
-            )
+            with self._lock.read():
+                results = self.collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=top_k,
+                    where=self._visible_filter(),
+                    include=["documents", "metadatas", "distances"]
+                )
             
             # 格式化结果
-            formatted_results = []
-            
             if results['documents'] and results['documents'][0]:
-                for i, (doc, metadata, distance) in enumerate(zip(
+                return self._format_results(
+                    results['ids'][0],
                     results['documents'][0],
                     results['metadatas'][0],
                     results['distances'][0]
-                )):
-                    formatted_results.append({
-                        "content": doc,
-                        "metadata": metadata,
-                        "score": 1 - distance,  # 将距离转换为相似度分数
-                        "index": i
-                    })
+                )
             
-            return formatted_results
+            return []
             
         except Exception as e:
             print(f"向量搜索失败: {str(e)}")
             return []
 
+    def search_many(
+        self, queries: List[str], top_k: int = TOP_K, priority: int = PRIORITY_BULK
+    ) -> List[Optional[List[Dict]]]:
+        """批量搜索相关文档，返回结果与输入顺序一致
+
+        失败按批次隔离：某个问题的embedding或检索失败时，只有该问题的结果为None，
+        其余问题照常返回；调用方应跳过None，而不是把它当作"没有检索到内容"。
+        """
+        if not queries:
+            return []
+
+        # 批量获取所有查询的embedding，失败的批次逐条重试，找出出错的问题
+        texts = [self._truncate(query) for query in queries]
+        query_embeddings: List[Optional[List[float]]] = []
+        for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            batch = texts[i:i + EMBEDDING_BATCH_SIZE]
+            try:
+                query_embeddings.extend(self._create_embeddings(batch, priority))
+                continue
+            except Exception as e:
+                print(f"批量获取embedding失败，逐条重试 {len(batch)} 个问题: {str(e)}")
+            for text in batch:
+                try:
+                    query_embeddings.append(self._create_embeddings([text], priority)[0])
+                except Exception as e:
+                    print(f"问题embedding失败，跳过检索: {text[:50]}, 错误: {str(e)}")
+                    query_embeddings.append(None)
+
+        all_results: List[Optional[List[Dict]]] = [None] * len(queries)
+        valid = [i for i, embedding in enumerate(query_embeddings) if embedding is not None]
+        for start in range(0, len(valid), QUERY_BATCH_SIZE):
+            indices = valid[start:start + QUERY_BATCH_SIZE]
+            try:
+                # 一次检索多个查询向量
+                with self._lock.read():
+                    results = self.collection.query(
+                        query_embeddings=[query_embeddings[i] for i in indices],
+                        n_results=top_k,
+                        where=self._visible_filter(),
+                        include=["documents", "metadatas", "distances"]
+                    )
+            except Exception as e:
+                print(f"批量向量搜索失败（{len(indices)} 个问题）: {str(e)}")
+                continue
+            for i, ids, documents, metadatas, distances in zip(
+                indices, results['ids'], results['documents'], results['metadatas'], results['distances']
+            ):
+                all_results[i] = self._format_results(ids, documents, metadatas, distances)
+
+        return all_results
+
+    def list_filepaths(self) -> Set[str]:
+        """列出向量数据库中所有文档块所属的文件路径"""
+        filepaths = set()
+        offset = 0
+        while True:
+            with self._lock.read():
+                batch = self.collection.get(include=["metadatas"], limit=self.write_batch_size, offset=offset)
+            if not batch["ids"]:
+                return filepaths
+            filepaths.update(metadata.get("filepath", "") for metadata in batch["metadatas"])
+            offset += len(batch["ids"])
+
+    def has_file(self, filepath: str) -> bool:
+        """向量数据库中是否已有该文件的文档块"""
+        with self._lock.read():
+            return bool(self.collection.get(where={"filepath": filepath}, limit=1, include=[])["ids"])
+
+    def _list_file_chunk_ids(self, filepath: str) -> List[str]:
+        """列出某个文件当前的全部文档块ID（只读取ID）"""
+        chunk_ids = []
+        offset = 0
+        while True:
+            ids = self.collection.get(
+                where={"filepath": filepath}, limit=self.write_batch_size, offset=offset, include=[]
+            )["ids"]
+            if not ids:
+                return chunk_ids
+            chunk_ids.extend(ids)
+            offset += len(ids)
+
+    def _delete_ids(self, ids: List[str]) -> None:
+        """分批删除文档块"""
+        for i in range(0, len(ids), self.write_batch_size):
+            self.collection.delete(ids=ids[i:i + self.write_batch_size])
+
+    def _next_generation(self) -> int:
+        """分配新的文件版本号，跨进程重启也不会与残留的版本重复"""
+        self._last_generation = max(time.time_ns(), self._last_generation + 1)
+        return self._last_generation
+
+    def replace_file(self, filepath: str, chunks: Iterable[Chunk]) -> int:
+        """用新的文档块替换某个文件的全部文档块，返回新块数量
+
+        新块带上新的版本号，分批获取embedding后直接写入正式collection，内存占用与文件大小无关；
+        写入期间该版本在检索中被过滤掉，全部就绪后在写锁内使其生效并删除旧块，
+        检索只会看到替换前或替换后的完整状态，且只在删除旧块时短暂等待。
+        失败时删除已写入的新块，旧块保持不变。进程在写入中途退出时，
+        残留的新块会在监听模式启动后重新同步该文件时一并删除。
+        """
+        old_ids = self._list_file_chunk_ids(filepath)
+
+        with self._lock.write():
+            generation = self._next_generation()
+            self._pending_generations.add(generation)
+
+        new_ids = []
+        try:
+            chunks = iter(chunks)
+            while True:
+                batch = list(islice(chunks, self.write_batch_size))
+                if not batch:
+                    break
+                embeddings = self.get_embeddings([chunk.content for chunk in batch], priority=PRIORITY_BULK)
+                ids = [self.make_chunk_id(chunk, generation) for chunk in batch]
+                self.collection.upsert(
+                    embeddings=embeddings,
+                    documents=[chunk.content for chunk in batch],
+                    metadatas=[self.make_metadata(chunk, generation) for chunk in batch],
+                    ids=ids
+                )
+                new_ids.extend(ids)
+        except BaseException:
+            # 新版本尚未生效，直接删除后再移出过滤列表
+            self._delete_ids(new_ids)
+            with self._lock.write():
+                self._pending_generations.discard(generation)
+            raise
+
+        with self._lock.write():
+            self._pending_generations.discard(generation)
+            self._delete_ids(old_ids)
+
+        self.checkpoint.discard(set(old_ids))
+        return len(new_ids)
+
+    def remove_file(self, filepath: str) -> None:
+        """删除某个文件的全部文档块"""
+        removed = self._list_file_chunk_ids(filepath)
+        with self._lock.write():
+            self._delete_ids(removed)
+        self.checkpoint.discard(set(removed))
+
     def clear_collection(self) -> None:
         """清空collection"""
-        try:
-            self.chroma_client.delete_collection(name=self.collection_name)
-        except:
-            pass  # 如果集合不存在，忽略错误
-        
-        self.collection = self.chroma_client.create_collection(
-            name=self.collection_name, metadata={"description": "课程向量数据库"}
-        )
+        with self._lock.write():
+            try:
+                self.chroma_client.delete_collection(name=self.collection_name)
+            except:
+                pass  # 如果集合不存在，忽略错误
+            
+            self.collection = self.chroma_client.create_collection(
+                name=self.collection_name, metadata={"description": "课程向量数据库"}
+            )
+        self.checkpoint.reset()
+        self.dead_letter.reset()
+        self.file_state.reset()
         print("向量数据库已清空")
 
     def get_collection_count(self) -> int:
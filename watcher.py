@@ -0,0 +1,204 @@
+import os
+import time
+import threading
+from typing import Dict, Optional, Tuple
+
+from document_loader import DocumentLoader
+from text_splitter import TextSplitter
+from vector_store import VectorStore
+from chunk_record import get_file_info
+from ingest_state import file_signature
+from config import DATA_DIR, WATCH_POLL_INTERVAL, WATCH_DEBOUNCE_SECONDS, WATCH_MAX_RETRIES
+
+# 文件签名：(修改时间, 文件大小)，None表示文件已删除
+Signature = Optional[Tuple[int, int]]
+
+
+class DocumentWatcher:
+    """在后台轮询数据目录，将新增、修改、删除的文件同步到向量数据库"""
+
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        loader: DocumentLoader,
+        splitter: TextSplitter,
+        data_dir: str = DATA_DIR,
+        poll_interval: float = WATCH_POLL_INTERVAL,
+        debounce_seconds: float = WATCH_DEBOUNCE_SECONDS,
+    ):
+        self.vector_store = vector_store
+        self.loader = loader
+        self.splitter = splitter
+        self.data_dir = data_dir
+        self.poll_interval = poll_interval
+        self.debounce_seconds = debounce_seconds
+
+        # 已同步到向量数据库的文件签名
+        self._indexed: Dict[str, Signature] = {}
+        # 等待导入的文件：路径 -> (最新签名, 签名首次出现的时间)
+        self._pending: Dict[str, Tuple[Signature, float]] = {}
+        # 连续同步失败的次数
+        self._failures: Dict[str, int] = {}
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """启动后台监听线程"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="document-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止监听"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _scan(self) -> Dict[str, Signature]:
+        """扫描数据目录下所有支持的文件"""
+        signatures = {}
+        for root, dirs, files in os.walk(self.data_dir):
+            for file in files:
+                ext = os.path.splitext(file)[1].lower()
+                if ext not in self.loader.supported_formats:
+                    continue
+                file_path = os.path.join(root, file)
+                signature = file_signature(file_path)
+                if signature is not None:  # 扫描期间被删除时跳过
+                    signatures[file_path] = signature
+        return signatures
+
+    def _reconcile(self) -> None:
+        """启动时对比磁盘文件与向量数据库，补上离线期间的新增、修改和删除"""
+        now = time.monotonic()
+        current = self._scan()
+        indexed_paths = self.vector_store.list_filepaths()
+        states = self.vector_store.file_state.load()
+        unrecorded = {}
+
+        for file_path, signature in current.items():
+            if file_path not in indexed_paths:
+                self._pending[file_path] = (signature, now)
+                continue
+
+            recorded = states.get(file_path)
+            if recorded is None:
+                # 旧版本导入的数据没有签名记录，以当前文件为准
+                unrecorded[file_path] = signature
+                recorded = signature
+            self._indexed[file_path] = recorded
+            if recorded != signature:
+                self._pending[file_path] = (signature, now)
+
+        # 已从磁盘删除但仍在向量数据库中的文件
+        for file_path in indexed_paths - set(current):
+            self._indexed[file_path] = states.get(file_path, (0, 0))
+            self._pending[file_path] = (None, now)
+
+        if unrecorded:
+            self.vector_store.file_state.update(unrecorded)
+
+    def _run(self) -> None:
+        try:
+            self._reconcile()
+        except Exception as e:
+            print(f"\n启动监听时对比向量数据库出错: {str(e)}")
+
+        while not self._stop_event.is_set():
+            try:
+                self._poll()
+            except Exception as e:
+                print(f"\n监听数据目录出错: {str(e)}")
+            self._stop_event.wait(self.poll_interval)
+
+    def _poll(self) -> None:
+        now = time.monotonic()
+        current = self._scan()
+
+        # 记录变化；签名再次变化时重新计时（防抖）
+        for file_path in set(current) | set(self._indexed) | set(self._pending):
+            signature = current.get(file_path)
+            pending = self._pending.get(file_path)
+            if pending is not None:
+                if pending[0] != signature:
+                    self._pending[file_path] = (signature, now)
+            elif self._indexed.get(file_path) != signature:
+                self._pending[file_path] = (signature, now)
+
+        # 导入已稳定的文件
+        for file_path, (signature, since) in list(self._pending.items()):
+            if now - since < self.debounce_seconds:
+                continue
+            if self._stop_event.is_set():
+                return
+            del self._pending[file_path]
+
+            if signature == self._indexed.get(file_path):
+                continue  # 改动后又恢复原状
+
+            try:
+                self._sync_file(file_path, signature)
+                self._failures.pop(file_path, None)
+            except Exception as e:
+                failures = self._failures.get(file_path, 0) + 1
+                print(f"\n同步文件失败: {file_path}, 错误: {str(e)}")
+                if failures > WATCH_MAX_RETRIES:
+                    # 放弃重试，直到文件再次变化
+                    print(f"已重试 {WATCH_MAX_RETRIES} 次，文件再次修改前不再重试")
+                    self._failures.pop(file_path, None)
+                    self._indexed[file_path] = signature
+                    continue
+                # 指数退避后重试
+                self._failures[file_path] = failures
+                backoff = self.debounce_seconds * (2 ** failures - 1)
+                self._pending[file_path] = (signature, time.monotonic() + backoff)
+
+    def _sync_file(self, file_path: str, signature: Signature) -> None:
+        """将单个文件的最新状态写入向量数据库"""
+        if signature is None:
+            self.vector_store.remove_file(file_path)
+            self.vector_store.file_state.update({file_path: None})
+            self._indexed.pop(file_path, None)
+            print(f"\n[监听] 已移除: {file_path}")
+            return
+
+        if self.loader.is_streamed(file_path):
+            # 超大TXT文件边读取边分批写入，内存占用与文件大小无关
+            self._sync_streamed_file(file_path, signature)
+            return
+
+        # 读取失败时抛出异常，保留旧块并进入重试，而不是用空内容替换
+        documents = self.loader.load_document(file_path, strict=True)
+        if not documents and self.vector_store.has_file(file_path):
+            # 文件可能正在写入或被其他程序占用
+            raise ValueError("未读取到任何内容，但该文件此前已有文档块")
+        chunks = self.splitter.split_documents(documents)
+        count = self.vector_store.replace_file(file_path, chunks)
+        self._mark_synced(file_path, signature, count)
+
+    def _sync_streamed_file(self, file_path: str, signature: Signature) -> None:
+        """流式同步超大TXT文件，样本检测为UTF-8但中途解码失败时改用GBK重新读取"""
+        encodings = self.loader.txt_encodings(file_path)
+        for attempt, encoding in enumerate(encodings):
+            chunks = self.splitter.split_document_stream(
+                self.loader.iter_txt(file_path, encoding=encoding), get_file_info(file_path)
+            )
+            try:
+                # 失败时replace_file会丢弃已写入的新块，旧块保持不变
+                count = self.vector_store.replace_file(file_path, chunks)
+            except UnicodeDecodeError:
+                if attempt + 1 == len(encodings):
+                    raise
+                print(f"\n[监听] 按 {encoding} 解码失败，改用 {encodings[attempt + 1]} 重新读取: {file_path}")
+                continue
+            self._mark_synced(file_path, signature, count)
+            return
+
+    def _mark_synced(self, file_path: str, signature: Signature, count: int) -> None:
+        """记录文件已同步"""
+        self.vector_store.file_state.update({file_path: signature})
+        self._indexed[file_path] = signature
+        print(f"\n[监听] 已更新: {file_path}（{count} 个文档块）")